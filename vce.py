@@ -1,20 +1,39 @@
 import argparse
-import json
+import functools
+import os
 import re
 from abc import ABC, abstractmethod
 
+try:
+    from orjson import loads as _loadJson # faster JSON parser if installed
+except ImportError:
+    from json import loads as _loadJson
+
 #
 # Project code property: 'ro.vehicle.config.AAA'
 #
 kProjectCodeProperty = 'AAA'
 
+#
+# Position string format: "[byte_idx][high_bit:low_bit]"
+#
+kPositionRegex = re.compile(r'\[(\d+)\]\[(\d+):(\d+)\]')
+
+#
+# Bitstrings of all byte values: kBitstrTable[b] == format(b, '08b')
+#
+kBitstrTable = tuple(format(b, '08b') for b in range(256))
+
 #
 # Reads binary files
 # @param[in] path: File path
 #
 def readConfig(path: str) -> bytearray:
     with open(path, 'rb') as cfg:
-        return bytearray(cfg.read())
+        data = bytearray(os.fstat(cfg.fileno()).st_size)
+        del data[cfg.readinto(data):] # in case file shrank
+        data += cfg.read()            # remainder: file grew or has no size (pipe)
+    return data
     
 #
 # Writes binary files
@@ -26,61 +45,90 @@ def writeConfig(path: str, data: bytes):
         cfg.write(data)
 
 #
-# Reads JSON in UTF-8 encoding
+# Reads JSON in UTF-8 encoding and parses all property positions
+# @remark File is parsed as raw bytes to skip decoding to str
 # @param[in] path: File path
 #
 def readMap(path: str):
-    with open(path, 'r', encoding = 'utf-8') as map:
-        return json.load(map)
+    with open(path, 'rb') as cfg:
+        map = _loadJson(cfg.read())
+
+    table = {name: getPosition(pos) for name, pos in map['ro.vehicle.config'].items()}
+    map['ro.vehicle.config'] = table
+    return map
     
 #
-# Extracts position table from JSON
+# Extracts parsed position table from JSON
 # @param[in] map: JSON config
 #
-def getPositionTable(map) -> str:
+def getPositionTable(map) -> dict:
     return map['ro.vehicle.config']
 
 #
 # Config entry position
+# @remark Stored as tuple (byte_idx, shift, value_mask, clear_mask) for fast unpacking
 #
-class Position:
-    byte_idx = 0
-    high_bit = 0
-    low_bit = 0
+class Position(tuple):
+    __slots__ = ()
 
-    def _isValidBitPos(self, pos: int) -> bool:
+    @staticmethod
+    def _isValidBitPos(pos: int) -> bool:
         return 0 <= pos <= 7
 
     #
     # @param[in] pos: Position string in format "[byte_idx][high_bit:low_bit]"
     #
-    def __init__(self, pos: str):
-        match = re.match(r'\[(\d+)\]\[(\d+):(\d+)\]', pos)
+    def __new__(cls, pos: str):
+        match = kPositionRegex.match(pos)
         if not match:
             raise ValueError(f'Invalid position format: {pos}')
         
         byte_idx, high_bit, low_bit = map(int, match.groups())
-        if not self._isValidBitPos(high_bit):
+        if not cls._isValidBitPos(high_bit):
             raise OverflowError(f'High bit {high_bit} should be in range [0...7]')
 
-        if not self._isValidBitPos(low_bit):
+        if not cls._isValidBitPos(low_bit):
             raise OverflowError(f'Low bit {low_bit} should be in range [0...7]')
         
         if low_bit > high_bit:
             raise OverflowError(f'Low bit {low_bit} should be less than high bit {high_bit}')
         
-        self.byte_idx = byte_idx
-        self.high_bit = high_bit
-        self.low_bit = low_bit
+        value_mask = (1 << (high_bit - low_bit + 1)) - 1
+        clear_mask = ~(value_mask << low_bit) & 0xFF
+        return super().__new__(cls, (byte_idx, low_bit, value_mask, clear_mask))
+
+    @property
+    def byte_idx(self) -> int:
+        return self[0]
+
+    @property
+    def shift(self) -> int: # equals low bit
+        return self[1]
+
+    @property
+    def value_mask(self) -> int:
+        return self[2]
+
+    @property
+    def clear_mask(self) -> int:
+        return self[3]
+
+    @property
+    def width(self) -> int:
+        return self[2].bit_length()
+
+    @property
+    def high_bit(self) -> int:
+        return self[1] + self[2].bit_length() - 1
+
 #
-# Reads bits at a given position
-# @param[in] data: Configuration bytes
-# @param[in] pos: Position
-# @return Little-endian bitstring 
+# Returns parsed position (cached per position string)
+# @remark Positions are immutable, so instances are shared between callers
+# @param[in] pos: Position string in format "[byte_idx][high_bit:low_bit]"
 #
-def readBits(data: bytes, pos: Position) -> str:
-    bitstr = format(data[pos.byte_idx], '08b')
-    return bitstr[8 - pos.high_bit - 1:8 - pos.low_bit]
+@functools.lru_cache(maxsize = None)
+def getPosition(pos: str) -> Position:
+    return Position(pos)
 
 #
 # Reads number at a given position
@@ -89,46 +137,78 @@ def readBits(data: bytes, pos: Position) -> str:
 # @return Number
 #
 def readNumber(data: bytes, pos: Position) -> int:
-    return int(readBits(data, pos), 2)
+    byte_idx, shift, value_mask, _ = pos
+    return (data[byte_idx] >> shift) & value_mask
 
 #
-# Writes bits at a given position
+# Reads bits at a given position
+# @param[in] data: Configuration bytes
+# @param[in] pos: Position
+# @return Little-endian bitstring 
+#
+def readBits(data: bytes, pos: Position) -> str:
+    byte_idx, shift, value_mask, _ = pos
+    end = 8 - shift
+    return kBitstrTable[data[byte_idx]][end - value_mask.bit_length():end]
+
+#
+# Writes integer bits at a given position
+# @remark Value is truncated to the position width
 # @param[in,out] data: Configuration bytes
 # @param[in] pos: Position
+# @param[in] value: Number
+# @return Previous number
+#
+def writeBitsInt(data: bytearray, pos: Position, value: int) -> int:
+    byte_idx, shift, value_mask, clear_mask = pos
+    old_byte = data[byte_idx]
+    data[byte_idx] = (old_byte & clear_mask) | ((value & value_mask) << shift)
+    return (old_byte >> shift) & value_mask
+
+#
+# Checks that bitstring fits a given position
+# @param[in] pos: Position
 # @param[in] value: Little-endian bitstring
 #
-def writeBits(data: bytearray, pos: Position, value: str) -> str:
+def validateBits(pos: Position, value: str) -> None:
     value_len = len(value)
-    expected_len = pos.high_bit - pos.low_bit + 1
+    expected_len = pos.width
     if value_len != expected_len:
         raise OverflowError(f'Bistring length {value_len} is not equal to expected {expected_len}')
-    
-    bitstr = format(data[pos.byte_idx], '08b')
-    bitlist = list(bitstr)
-    bitlist[8 - pos.high_bit - 1:8 - pos.low_bit] = list(value)
-    data[pos.byte_idx] = int(''.join(bitlist), 2)
-    return bitstr[8 - pos.high_bit - 1:8 - pos.low_bit]
+
+    if value.lstrip('01'): # non-empty remainder means a character other than 0 or 1
+        raise ValueError(f'Bitstring {value} should contain only 0 and 1')
+
+#
+# Checks that number fits a given position
+# @param[in] pos: Position
+# @param[in] value: Number
+#
+def validateNumber(pos: Position, value: int) -> None:
+    if value >> pos.width: # bits set above position width
+        raise OverflowError(f'Value {value} is too large')
+
+#
+# Writes bits at a given position
+# @param[in,out] data: Configuration bytes
+# @param[in] pos: Position
+# @param[in] value: Little-endian bitstring
+#
+def writeBits(data: bytearray, pos: Position, value: str) -> str:
+    validateBits(pos, value)
+    old_bitstr = readBits(data, pos)
+    writeBitsInt(data, pos, int(value, 2))
+    return old_bitstr
 
 #
 # Writes number at a given position
-# @remark Value is converted to a bit string of required length (padded with leading zeros)
 # @param[in,out] data: Configuration bytes
 # @param[in] pos: Position
 # @param[in] value: Number
 #
 def writeNumber(data: bytearray, pos: Position, value: int) -> int:
-    bitstr = format(value, 'b')
-    actual_len = len(bitstr)
-    expected_len = pos.high_bit - pos.low_bit + 1
-
-    if actual_len > expected_len:
-        raise OverflowError(f'Value {value} is too large')
-    
-    if actual_len < expected_len:
-        bitstr = '0' * (expected_len - actual_len) + bitstr 
-    
-    old_bitstr = writeBits(data, pos, bitstr)
-    return int(old_bitstr, 2)
+    validateNumber(pos, value)
+    return writeBitsInt(data, pos, value)
 
 #
 # Validates config size and project code against map
@@ -142,12 +222,14 @@ def validateConfig(data: bytes, map) -> None:
         raise ValueError(f'Config size {config_size} should be {expected_size}')
     
     table = getPositionTable(map)
-    project_code = readNumber(data, Position(table['AAA']))
+    project_code = readNumber(data, table[kProjectCodeProperty])
     if not project_code in map['project_code']:
         raise ValueError(f'Unsupported project code {project_code}')
     
-    for property, pos in table.items():
-        position = Position(pos)
+    if max((position.byte_idx for position in table.values()), default = -1) < config_size:
+        return
+
+    for property, position in table.items(): # find property to report
         if position.byte_idx >= config_size:
             raise OverflowError(f'Property {property} has invalid index {position.byte_idx}')
         
@@ -155,16 +237,9 @@ def validateConfig(data: bytes, map) -> None:
 # Property name and value
 #
 class Property:
-    @staticmethod
-    def _splitProps(sep: str, props: str):
-        split = props.split(sep)
-        if len(split) < 2:
-            return None
-        return split
-    
     @staticmethod
     def _extractBitstr(s: str) -> str:
-        if len(s) == 0 or not all(c in '01' for c in s):
+        if len(s) == 0: # characters are checked against position in validate()
             raise ValueError(f'Bitstring {s} should contain only 0 and 1')
         return s
     
@@ -176,27 +251,44 @@ class Property:
         return n
 
     def __init__(self, props: str):
-        split = Property._splitProps(':', props)
-        if not split is None:
-            self.name = split[0]
-            self.value = Property._extractBitstr(split[1])
+        name, sep, value = props.partition(':')
+        if sep:
+            self.name = name
+            self.value = Property._extractBitstr(value)
             return
         
-        split = Property._splitProps('=', props)
-        if not split is None:
-            self.name = split[0]
-            self.value = Property._extractNumber(split[1])
+        name, sep, value = props.partition('=')
+        if sep:
+            self.name = name
+            self.value = Property._extractNumber(value)
             return
 
         raise ValueError(f'Argument {props} should be in format PROPERTY:BITSTRING or PROPERTY=DECVALUE or PROPERTY=HEXVALUE')
     
+    #
+    # Checks that property value fits position (length first, then characters)
+    # @param[in] pos: Position
+    #
+    def validate(self, pos: Position) -> None:
+        if isinstance(self.value, str):
+            validateBits(pos, self.value)
+        else: # value should be int
+            validateNumber(pos, self.value)
+
+    #
+    # Writes property value to config
+    # @remark Value should be checked with validate() first
+    # @param[in,out] data: Configuration bytes
+    # @param[in] pos: Position
+    #
     def apply(self, data: bytearray, pos: Position) -> None:
         value = self.value
 
         if isinstance(value, str):
-            old_value = writeBits(data, pos, value)
+            old_value = readBits(data, pos)
+            writeBitsInt(data, pos, int(value, 2))
         else: # value should be int
-            old_value = writeNumber(data, pos, value)
+            old_value = writeBitsInt(data, pos, value)
         
         print(f'Update property {self.name}: {old_value} -> {value}')
     
@@ -208,7 +300,7 @@ class ISerializer(ABC):
         mode = ['r', 'w'][writeable] + ['', 'b'][self._isBinary()]
         return open(path, mode)
 
-    def read(self, path: str) -> bytes:
+    def read(self, path: str) -> bytearray:
         with self._openFile(path, False) as cfg:
             return self._decode(cfg.read())
 
@@ -221,33 +313,55 @@ class ISerializer(ABC):
         pass
 
     @abstractmethod
-    def _decode(self, data) -> bytes:
+    def _decode(self, data) -> bytearray:
         pass
 
     @abstractmethod
     def _encode(self, data: bytes):
         pass
 
+#
+# Calculates CRC-8 (polynomial 0x07, zero initial value) of a single byte (bit-by-bit)
+# @param[in] b: Byte value
+# @return CRC byte
+#
+def _calcCrc8Byte(b: int) -> int:
+    crc = b
+    for _ in range(8):
+        crc <<= 1
+        if (crc & 0x100) != 0:
+            crc ^= 0x107
+    return crc
+
+#
+# CRC lookup table indexed by (CRC XOR data byte)
+#
+kCrc8Table = bytes(_calcCrc8Byte(b) for b in range(256))
+
 #
 # Binary configuration serializer (for VehicleConfig.bin with CRC in last byte)
 #
 class BinarySerializer(ISerializer): 
     @staticmethod
     def _calcCrc8(data: bytes):
+        table = kCrc8Table
         crc = 0
         for b in data:
-            crc ^= b << 8
-            for _ in range(8):
-                if (crc & 0x8000) != 0:
-                    crc ^= 0x8380
-                crc *= 2
-        return (crc >> 8) & 0xFFFFFF
+            crc = table[crc ^ b]
+        return crc
     
+    def read(self, path: str) -> bytearray:
+        return self._decode(readConfig(path))
+
+    def write(self, path: str, data: bytes) -> None:
+        writeConfig(path, self._encode(data))
+
     def _isBinary(self) -> bool:
         return True
 
-    def _decode(self, data: bytes) -> bytes:
-        return data[:-1]  # config without last byte
+    def _decode(self, data: bytearray) -> bytearray:
+        del data[-1:]  # config without last byte (in place, no copy)
+        return data
 
     def _encode(self, data: bytes) -> bytes:
         return data + bytes([BinarySerializer._calcCrc8(data)])
@@ -259,8 +373,8 @@ class TextSerializer(ISerializer):
     def _isBinary(self) -> bool:
         return False
 
-    def _decode(self, data: str) -> bytes:
-        return bytes.fromhex(data)
+    def _decode(self, data: str) -> bytearray:
+        return bytearray.fromhex(data)
 
     def _encode(self, data: bytes) -> str:
         return data.hex()
@@ -309,25 +423,34 @@ def main():
     src, dst = getFilePaths(args.type == 'binary', args.src, args.dst)
 
     print(f'Read config from {src}')
-    data = bytearray(serializer.read(src))
+    data = serializer.read(src)
     validateConfig(data, map)
-    updated = False
+    table = getPositionTable(map)
+    updates = [] # (property, position) pairs, all validated before writing
 
     for property in [Property(p) for p in args.props]:
         name = property.name
         if name == kProjectCodeProperty:
             raise ValueError(f'Project code change is not supported')
 
-        position = getPositionTable(map).get(name)
+        position = table.get(name)
         if position is None:
             raise KeyError(f"Property '{name}' not found in map")
         
-        property.apply(data, Position(position))
-        updated = True
+        property.validate(position)
+        updates.append((property, position))
+
+    original = {} # byte index -> byte value before the first write
+    for property, position in updates:
+        byte_idx, *_ = position
+        original.setdefault(byte_idx, data[byte_idx])
+        property.apply(data, position)
 
-    if updated:
+    if any(data[idx] != byte for idx, byte in original.items()):
         print(f'Save updated config to {dst}')
-        serializer.write(dst, data)
+    else:
+        print(f'Config is not changed, save it to {dst}')
+    serializer.write(dst, data)
 
 #
 # Launches main